@@ -1,27 +1,68 @@
-import os
-from typing import Dict, Any, List, Optional
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Dict, Any, AsyncIterator, Callable, List, Optional, Tuple
 
 from langchain_ollama import OllamaLLM
 from langchain.agents import AgentExecutor, create_react_agent
+from langchain_core.agents import AgentAction
 from langchain_core.prompts import PromptTemplate
 from langchain_community.utilities.sql_database import SQLDatabase
 from langchain_community.agent_toolkits.sql.toolkit import SQLDatabaseToolkit
-from langchain.chains.conversation.memory import ConversationBufferMemory
+from langchain.chains.conversation.memory import ConversationBufferWindowMemory
+
+from database import get_db_version
 
 # Define database path consistently
 DB_FILE = "employee_database.db"
-DB_URI = f"sqlite:///{DB_FILE}"
+# mode=rw makes SQLite fail instead of silently creating an empty database file
+DB_URI = f"sqlite:///file:{DB_FILE}?mode=rw&uri=true"
+
+
+class CachedSQLDatabase(SQLDatabase):
+    """
+    SQLDatabase that memoizes schema info between data changes.
+
+    The agent's get_schema tool runs on nearly every query and reflects the table DDL
+    and sample rows each time; the result only changes when the ETL job writes, which is
+    detected via get_db_version(). Table names are already held in memory by the base class.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self._metadata_cache: Dict[tuple, Any] = {}
+        self._metadata_version = None
+        super().__init__(*args, **kwargs)
+
+    def invalidate(self) -> None:
+        """Drop all cached schema info."""
+        self._metadata_cache.clear()
+
+    def _get_cached(self, key: tuple, compute: Callable[[], Any]) -> Any:
+        version = get_db_version()
+        if version != self._metadata_version:
+            self.invalidate()
+            self._metadata_version = version
+
+        if key not in self._metadata_cache:
+            self._metadata_cache[key] = compute()
+        return self._metadata_cache[key]
+
+    def get_table_info(self, table_names: Optional[List[str]] = None, get_col_comments: bool = False) -> str:
+        key = ("info", tuple(table_names) if table_names is not None else None, get_col_comments)
+        return self._get_cached(
+            key, lambda: super(CachedSQLDatabase, self).get_table_info(table_names, get_col_comments)
+        )
 
-# Check if database exists after initialization
-if not os.path.exists(DB_FILE):
-    raise FileNotFoundError(f"Database file {DB_FILE} not found. Please ensure the database is created.")
 
 # Initialize the Ollama LLM
 llm = OllamaLLM(model="gemma3:12b", temperature=0.5)
 
 # Connect to the SQLite database with debug info
 try:
-    db = SQLDatabase.from_uri(
+    db = CachedSQLDatabase.from_uri(
         DB_URI,
         sample_rows_in_table_info=2  # Include sample rows to help the agent understand data structure
     )
@@ -41,12 +82,45 @@ toolkit = SQLDatabaseToolkit(db=db, llm=llm)
 # Explicitly get tools from the toolkit
 tools = toolkit.get_tools()
 
-# Memory storage for conversations by conversation_id
-conversation_memories = {}
+# Memory storage for conversations by conversation_id, evicted least-recently-used first
+MAX_CONVERSATIONS = 10_000
+conversation_memories = OrderedDict()
+
+# Number of previous exchanges kept in the prompt, so its size stays bounded
+MEMORY_WINDOW_SIZE = 5
+
+# Agent executors cached by conversation_id, evicted least-recently-used first
+MAX_CACHED_EXECUTORS = 1000
+agent_executors = OrderedDict()
+
+# Guards conversation_memories and agent_executors, which are evicted together; reentrant
+# because get_agent_executor creates the memory through get_conversation_memory
+_conversation_lock = threading.RLock()
+
+# Agent iteration budgets: lookups need list_tables, get_schema, one query and an answer,
+# plus slack for a parsing error or a corrected query; aggregations and comparisons may
+# need several query/fix rounds
+SIMPLE_QUERY_MAX_ITERATIONS = 6
+COMPLEX_QUERY_MAX_ITERATIONS = 10
+MAX_EXECUTION_TIME = 60  # seconds, stops a looping agent regardless of iterations
+# Output AgentExecutor returns when it hits max_iterations or max_execution_time
+AGENT_STOPPED_OUTPUT = "Agent stopped due to iteration limit or time limit."
+# Matched as whole words, so names and job titles ("Frank", "accountant") don't count
+COMPLEX_QUERY_PATTERN = re.compile(
+    r"\b(?:averages?|avg|mean|totals?|sum|counts?|how many|per|each|group(?:ed)?|"
+    r"compared?|versus|vs|rank(?:ed|ing)?|top|most|least|highest|lowest|"
+    r"distribution|percentages?|ratio|trends?|between|and)\b"
+)
+
+# Full agent responses cached by (conversation_id, normalized query, database version)
+RESPONSE_CACHE_SIZE = 2048
+RESPONSE_CACHE_TTL = 300  # seconds
+response_cache = OrderedDict()
+# Guards response_cache, which /query worker threads and the /query/stream event loop share
+_response_cache_lock = threading.Lock()
 
 # Define a better prompt template that includes more context about the database and conversation history
-prompt = PromptTemplate.from_template(
-    """You are an AI assistant that helps retrieve and provide information about employees from a SQL database.
+PROMPT_TEMPLATE = """You are an AI assistant that helps retrieve and provide information about employees from a SQL database.
 
 You have access to the following tools: {tools}
 
@@ -55,7 +129,7 @@ Previous conversation history:
 
 IMPORTANT GUIDELINES:
 1. First, check what tables are available using the list_tables tool
-2. Get the schema for relevant tables using the get_schema tool
+2. Get the schema for all relevant tables in one get_schema call by passing them as a comma-separated list
 3. Formulate a SQL query to answer the question
 4. Execute the query and interpret the results
 5. If you encounter errors, check the schema again and fix your query
@@ -85,13 +159,21 @@ Final Answer: the final answer to the original input question
 
 Question: {input}
 Thought: {agent_scratchpad}"""
-)
 
-# Create the ReAct agent with the improved prompt
-agent = create_react_agent(llm, tools, prompt)
+
+@lru_cache(maxsize=1)
+def _get_prompt() -> PromptTemplate:
+    """Parse the agent prompt template once and reuse it for every request."""
+    return PromptTemplate.from_template(PROMPT_TEMPLATE)
 
 
-def get_conversation_memory(conversation_id: str) -> ConversationBufferMemory:
+@lru_cache(maxsize=1)
+def _get_agent():
+    """Build the ReAct agent with the improved prompt once and reuse it for every request."""
+    return create_react_agent(llm, tools, _get_prompt())
+
+
+def get_conversation_memory(conversation_id: str) -> ConversationBufferWindowMemory:
     """
     Get or create conversation memory for a specific conversation ID.
 
@@ -99,16 +181,190 @@ def get_conversation_memory(conversation_id: str) -> ConversationBufferMemory:
         conversation_id: Unique identifier for the conversation.
 
     Returns:
-        A ConversationBufferMemory instance for the conversation.
+        A ConversationBufferWindowMemory instance for the conversation.
     """
-    if conversation_id not in conversation_memories:
-        conversation_memories[conversation_id] = ConversationBufferMemory(
+    with _conversation_lock:
+        if conversation_id in conversation_memories:
+            conversation_memories.move_to_end(conversation_id)
+            return conversation_memories[conversation_id]
+
+        memory = ConversationBufferWindowMemory(
+            k=MEMORY_WINDOW_SIZE,
             memory_key="chat_history",
             return_messages=True,
             output_key="output"
         )
+        conversation_memories[conversation_id] = memory
+        if len(conversation_memories) > MAX_CONVERSATIONS:
+            evicted_id, _ = conversation_memories.popitem(last=False)
+            # An executor is bound to its memory, so it goes with it
+            agent_executors.pop(evicted_id, None)
 
-    return conversation_memories[conversation_id]
+        return memory
+
+
+def get_agent_executor(conversation_id: str) -> AgentExecutor:
+    """
+    Get or create the agent executor for a specific conversation ID.
+
+    Args:
+        conversation_id: Unique identifier for the conversation.
+
+    Returns:
+        An AgentExecutor bound to the conversation's memory.
+    """
+    with _conversation_lock:
+        if conversation_id in agent_executors:
+            agent_executors.move_to_end(conversation_id)
+            # Keep the conversation's memory from aging out while it is in use
+            conversation_memories.move_to_end(conversation_id)
+            return agent_executors[conversation_id]
+
+        agent_executor = AgentExecutor(
+            agent=_get_agent(),
+            tools=tools,
+            verbose=True,
+            handle_parsing_errors=True,
+            max_iterations=COMPLEX_QUERY_MAX_ITERATIONS,
+            max_execution_time=MAX_EXECUTION_TIME,
+            memory=get_conversation_memory(conversation_id),
+            return_intermediate_steps=True
+        )
+        agent_executors[conversation_id] = agent_executor
+        if len(agent_executors) > MAX_CACHED_EXECUTORS:
+            agent_executors.popitem(last=False)
+
+        return agent_executor
+
+
+def normalize_query(query: str) -> str:
+    """
+    Normalize a query so trivially different phrasings share a cache entry.
+
+    Args:
+        query: The query string from the user.
+
+    Returns:
+        The lowercased query with whitespace collapsed.
+    """
+    return " ".join(query.lower().split())
+
+
+def get_cached_response(cache_key: tuple) -> Optional[Dict[str, Any]]:
+    """
+    Look up a cached agent response, dropping it if it has expired.
+
+    Args:
+        cache_key: Tuple of conversation ID, normalized query and database version.
+
+    Returns:
+        The cached response dictionary, or None on a miss.
+    """
+    with _response_cache_lock:
+        entry = response_cache.get(cache_key)
+        if entry is None:
+            return None
+
+        cached_at, response = entry
+        if time.monotonic() - cached_at > RESPONSE_CACHE_TTL:
+            response_cache.pop(cache_key, None)
+            return None
+
+        response_cache.move_to_end(cache_key)
+        return response
+
+
+@lru_cache(maxsize=1024)
+def get_iteration_budget(normalized_query: str) -> int:
+    """
+    Pick the agent's max_iterations from a cheap keyword classification of the query.
+
+    Args:
+        normalized_query: The query as returned by normalize_query.
+
+    Returns:
+        The iteration budget for simple lookups or for complex analytical questions.
+    """
+    if len(normalized_query.split()) > 20 or COMPLEX_QUERY_PATTERN.search(normalized_query):
+        return COMPLEX_QUERY_MAX_ITERATIONS
+    return SIMPLE_QUERY_MAX_ITERATIONS
+
+
+def cache_response(cache_key: tuple, response: Dict[str, Any]) -> None:
+    """
+    Store an agent response, evicting the least recently used entry when full.
+
+    Args:
+        cache_key: Tuple of conversation ID, normalized query and database version.
+        response: The response dictionary returned to the client.
+    """
+    with _response_cache_lock:
+        response_cache[cache_key] = (time.monotonic(), response)
+        response_cache.move_to_end(cache_key)
+        if len(response_cache) > RESPONSE_CACHE_SIZE:
+            response_cache.popitem(last=False)
+
+
+def build_response(conversation_id: str, query: str, result: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Shape an AgentExecutor result into the response dictionary returned to clients.
+
+    Args:
+        conversation_id: Unique identifier for the conversation.
+        query: The query string from the user.
+        result: The output of the agent executor, including intermediate steps.
+
+    Returns:
+        A dictionary containing the agent's response and any retrieved information.
+    """
+    return {
+        "conversation_id": conversation_id,
+        "query": query,
+        "response": result["output"],
+        "steps": [
+            {
+                "tool": step[0].tool,
+                "input": step[0].tool_input,
+                "output": step[1]
+            } for step in result.get("intermediate_steps", [])
+        ],
+        # A run cut off by the iteration or time limit has no real answer
+        "success": result["output"] != AGENT_STOPPED_OUTPUT
+    }
+
+
+def _prepare_run(query: str, conversation_id: str) -> Tuple[AgentExecutor, tuple, Optional[Dict[str, Any]]]:
+    """
+    Look up a query in the response cache and, on a miss, prepare an executor to run it.
+
+    Args:
+        query: The query string from the user.
+        conversation_id: Unique identifier for the conversation.
+
+    Returns:
+        A tuple of the executor to run, the response cache key and the cached response
+        (already recorded in the conversation memory), or None on a cache miss.
+    """
+    # Reuse the agent executor (and its memory) for this conversation
+    agent_executor = get_agent_executor(conversation_id)
+    normalized_query = normalize_query(query)
+
+    # Serve repeated questions from the cache until the data changes
+    cache_key = (conversation_id, normalized_query, get_db_version())
+    cached = get_cached_response(cache_key)
+    if cached is not None:
+        # Record the exchange so follow-up questions still have it as context
+        agent_executor.memory.save_context({"input": query}, {"output": cached["response"]})
+        print(f"Conversation {conversation_id} served from response cache")
+        return agent_executor, cache_key, dict(cached, query=query)
+
+    # Run with an iteration budget sized to the query's complexity. The budget is set on a
+    # shallow copy (sharing the memory), so overlapping requests in the same conversation
+    # don't overwrite each other's limit on the shared executor.
+    budgeted_executor = agent_executor.model_copy(
+        update={"max_iterations": get_iteration_budget(normalized_query)}
+    )
+    return budgeted_executor, cache_key, None
 
 
 def process_agent_query(query: str, conversation_id: Optional[str] = None) -> Dict[str, Any]:
@@ -125,46 +381,94 @@ def process_agent_query(query: str, conversation_id: Optional[str] = None) -> Di
     try:
         # If no conversation ID is provided, generate a random one
         if not conversation_id:
-            import uuid
             conversation_id = str(uuid.uuid4())
 
-        # Get or create memory for this conversation
-        memory = get_conversation_memory(conversation_id)
+        budgeted_executor, cache_key, cached = _prepare_run(query, conversation_id)
+        if cached is not None:
+            return cached
 
-        # Create a new agent executor with the memory
-        agent_executor = AgentExecutor(
-            agent=agent,
-            tools=tools,
-            verbose=True,
-            handle_parsing_errors=True,
-            max_iterations=8,
-            memory=memory,
-            return_intermediate_steps=True
-        )
-
-        # Execute the query
-        result = agent_executor.invoke({
+        result = budgeted_executor.invoke({
             "input": query,
         })
 
-        # Include full details in the response
+        # Include full details in the response; only real answers are worth replaying
+        response = build_response(conversation_id, query, result)
+        if response["success"]:
+            cache_response(cache_key, response)
+
+        # For debugging purposes, print chat history length
+        chat_history = budgeted_executor.memory.chat_memory.messages
+        print(f"Conversation {conversation_id} has {len(chat_history)} messages")
+
+    except Exception as e:
         response = {
             "conversation_id": conversation_id,
             "query": query,
-            "response": result["output"],
-            "steps": [
-                {
-                    "tool": step[0].tool,
-                    "input": step[0].tool_input,
-                    "output": step[1]
-                } for step in result.get("intermediate_steps", [])
-            ],
-            "success": True
+            "response": f"Error processing your query: {str(e)}",
+            "steps": [],
+            "success": False
         }
 
-        # For debugging purposes, print chat history length
-        chat_history = memory.chat_memory.messages
-        print(f"Conversation {conversation_id} has {len(chat_history)} messages")
+    return response
+
+
+async def stream_agent_query(query: str, conversation_id: Optional[str] = None) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Process a query using the LangChain agent, yielding LLM tokens as they are generated.
+
+    Args:
+        query: The query string from the user.
+        conversation_id: Optional unique identifier for the conversation.
+
+    Yields:
+        Dictionaries with a "type" of "token" (a chunk of LLM output), "step" (a
+        finished tool call) or "final" (the same fields process_agent_query returns),
+        the latter always last.
+    """
+    # If no conversation ID is provided, generate a random one
+    if not conversation_id:
+        conversation_id = str(uuid.uuid4())
+
+    try:
+        budgeted_executor, cache_key, cached = _prepare_run(query, conversation_id)
+        if cached is not None:
+            yield {"type": "final", **cached}
+            return
+
+        response = None
+        pending_action = None
+        llm_calls = 0
+
+        async for event in budgeted_executor.astream_events({"input": query}, version="v2"):
+            if event["event"] == "on_llm_start":
+                # Separate the output of consecutive reasoning steps
+                if llm_calls:
+                    yield {"type": "token", "content": "\n\n"}
+                llm_calls += 1
+            elif event["event"] == "on_llm_stream":
+                chunk = event["data"]["chunk"]
+                token = getattr(chunk, "text", chunk)
+                if token:
+                    yield {"type": "token", "content": token}
+            elif event["event"] == "on_parser_end" and isinstance(event["data"].get("output"), AgentAction):
+                # Tool events don't carry the agent's string input, so remember the parsed action
+                pending_action = event["data"]["output"]
+            elif event["event"] == "on_tool_end":
+                action = pending_action if pending_action and pending_action.tool == event["name"] else None
+                yield {
+                    "type": "step",
+                    "tool": event["name"],
+                    "input": action.tool_input if action else "",
+                    "output": event["data"].get("output")
+                }
+            elif event["event"] == "on_chain_end" and not event["parent_ids"]:
+                # The root run is the executor itself; its output is the final result
+                response = build_response(conversation_id, query, event["data"]["output"])
+
+        if response is None:
+            raise RuntimeError("Agent finished without producing a final answer")
+        if response["success"]:
+            cache_response(cache_key, response)
 
     except Exception as e:
         response = {
@@ -175,4 +479,4 @@ def process_agent_query(query: str, conversation_id: Optional[str] = None) -> Di
             "success": False
         }
 
-    return response
\ No newline at end of file
+    yield {"type": "final", **response}
@@ -4,6 +4,7 @@ import sqlite3
 from sqlite3 import Error
 import logging
 import os
+import threading
 
 # Configure logging
 logging.basicConfig(
@@ -16,6 +17,15 @@ logger = logging.getLogger(__name__)
 # Database file path
 DB_FILE = "employee_database.db"
 
+# Pooled connections: one per thread, plus a registry so close_all() can reach them
+_local = threading.local()
+_pool_lock = threading.Lock()
+_pool_connections = []
+_pool_generation = 0
+
+# Set once create_tables has run in this process, so repeated calls skip the DDL
+_schema_initialized = False
+
 
 def initialize_database(force_recreate=False):
     """
@@ -24,14 +34,20 @@ def initialize_database(force_recreate=False):
     Args:
         force_recreate (bool): If True, recreate the database from scratch
     """
-    # If force_recreate is True and the database exists, delete it
-    if force_recreate and os.path.exists(DB_FILE):
-        try:
-            os.remove(DB_FILE)
-            logger.info(f"🗑️ Deleted existing database file: {DB_FILE}")
-        except OSError as e:
-            logger.error(f"❌ Could not delete database file: {e}")
-            return False
+    global _schema_initialized
+
+    # If force_recreate is True, delete the database along with its WAL side files
+    if force_recreate:
+        for path in (DB_FILE, f"{DB_FILE}-wal", f"{DB_FILE}-shm"):
+            try:
+                os.remove(path)
+                logger.info(f"🗑️ Deleted existing database file: {path}")
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.error(f"❌ Could not delete database file: {e}")
+                return False
+        _schema_initialized = False
 
     conn = create_connection()
     if conn is None:
@@ -42,7 +58,7 @@ def initialize_database(force_recreate=False):
         # Get the list of tables that already exist
         cursor = conn.cursor()
         cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
-        existing_tables = [table[0] for table in cursor.fetchall()]
+        existing_tables = [table["name"] for table in cursor.fetchall()]
 
         # Log existing tables
         if existing_tables:
@@ -60,7 +76,7 @@ def initialize_database(force_recreate=False):
         # Verify the schema of the employees table
         cursor.execute("PRAGMA table_info(employees)")
         columns = cursor.fetchall()
-        column_names = [col[1] for col in columns]
+        column_names = [col["name"] for col in columns]
         logger.info(f"✅ Verified employees table schema: {column_names}")
 
         expected_columns = ['id', 'name', 'department', 'position', 'email',
@@ -87,16 +103,123 @@ def create_connection():
     conn = None
     try:
         conn = sqlite3.connect(DB_FILE)
+        configure_connection(conn)
         logger.info(f"🔌 Successfully connected to database: {DB_FILE}")
         return conn
     except Error as e:
         logger.error(f"❌ Error connecting to database: {e}")
+        # Don't hand out a connection whose PRAGMAs were only partly applied
+        if conn is not None:
+            conn.close()
+
+    return None
+
+
+def configure_connection(conn):
+    """Apply the row factory and connection-level PRAGMAs shared by all database handles."""
+    # Rows support access by column name as well as by index
+    conn.row_factory = sqlite3.Row
+    # WAL lets the agent read while the ETL writes; NORMAL sync avoids an fsync per commit
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    # Wait on a locked database instead of failing with SQLITE_BUSY
+    conn.execute("PRAGMA busy_timeout=5000")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA mmap_size=268435456")
+
+
+def get_connection():
+    """
+    Get the calling thread's pooled database connection, opening it on first use.
+
+    The connection runs in autocommit mode (isolation_level=None), so callers
+    that need a transaction must issue BEGIN and commit or roll back themselves.
+    Pooled connections must not be closed by callers; use close_all() instead.
+    Because the connection is long-lived, its prepared-statement cache stays
+    warm, so repeated statements such as the ETL insert are not re-parsed.
+
+    Returns:
+        sqlite3.Connection, or None if the connection could not be opened
+    """
+    conn = getattr(_local, "conn", None)
+    if conn is not None and getattr(_local, "generation", None) == _pool_generation:
+        # The file may have been deleted and recreated (e.g. initialize_database(force_recreate=True)
+        # in another process); a handle on the old inode would keep writing to the unlinked file
+        if _get_file_id() == getattr(_local, "file_id", None):
+            return conn
+        logger.info(f"🔄 Database file {DB_FILE} was replaced, reopening pooled connection")
+        with _pool_lock:
+            if conn in _pool_connections:
+                _pool_connections.remove(conn)
+        conn.close()
+        _local.conn = None
+
+    conn = None
+    try:
+        conn = sqlite3.connect(DB_FILE, check_same_thread=False, isolation_level=None, cached_statements=256)
+        configure_connection(conn)
+        # Keep a 64 MB page cache warm across calls on this connection
+        conn.execute("PRAGMA cache_size=-65536")
+    except Error as e:
+        logger.error(f"❌ Error opening pooled connection: {e}")
+        if conn is not None:
+            conn.close()
+        return None
 
+    with _pool_lock:
+        _pool_connections.append(conn)
+        _local.conn = conn
+        _local.generation = _pool_generation
+        _local.file_id = _get_file_id()
+    logger.info(f"🔌 Opened pooled connection to database: {DB_FILE}")
     return conn
 
 
+def _get_file_id():
+    """Return the (device, inode) pair identifying the current database file, or None if it is missing."""
+    try:
+        st = os.stat(DB_FILE)
+    except FileNotFoundError:
+        return None
+    return st.st_dev, st.st_ino
+
+
+def close_all():
+    """Close every pooled connection, e.g. on shutdown."""
+    global _pool_generation
+
+    with _pool_lock:
+        for conn in _pool_connections:
+            conn.close()
+        logger.info(f"🔌 Closed {len(_pool_connections)} pooled connection(s)")
+        _pool_connections.clear()
+        # Invalidate the handles still cached in other threads' locals
+        _pool_generation += 1
+
+
+def get_db_version():
+    """
+    Return a token that changes whenever the database file is written.
+
+    The ETL job runs in a separate process, so the modification times of the
+    database and its WAL file are used to detect new data across processes.
+    """
+    version = []
+    for path in (DB_FILE, f"{DB_FILE}-wal"):
+        try:
+            version.append(os.stat(path).st_mtime_ns)
+        except OSError:
+            version.append(0)
+    return tuple(version)
+
+
 def create_tables(conn):
-    """Create the employees table if it doesn't exist."""
+    """Create the employees table if it doesn't exist; a no-op once it has run in this process."""
+    global _schema_initialized
+
+    if _schema_initialized:
+        return
+
     try:
         cursor = conn.cursor()
 
@@ -109,7 +232,7 @@ def create_tables(conn):
         missing_columns = []
 
         if table_def:
-            table_sql = table_def[0]
+            table_sql = table_def["sql"]
             for col in required_columns:
                 if col not in table_sql:
                     missing_columns.append(col)
@@ -135,15 +258,21 @@ def create_tables(conn):
                 username TEXT NOT NULL
             )
         ''')
+
+        # Index the columns the agent typically filters and sorts on
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_emp_dept ON employees(department)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_emp_name ON employees(name)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_emp_hire ON employees(hire_date)")
         conn.commit()
-        logger.info("✅ Table 'employees' created or already exists with correct schema")
+        _schema_initialized = True
+        logger.info("✅ Table 'employees' and its indexes created or already exist with correct schema")
     except Error as e:
         logger.error(f"❌ Error creating tables: {e}")
 
 
 def clear_table(table_name):
     """Clear all data from a table."""
-    conn = create_connection()
+    conn = get_connection()
     if conn is None:
         logger.error("❌ Error connecting to the database.")
         return False
@@ -157,8 +286,6 @@ def clear_table(table_name):
     except Error as e:
         logger.error(f"❌ Error clearing table {table_name}: {e}")
         return False
-    finally:
-        conn.close()
 
 
 # Execute database initialization if this script is run directly
@@ -1,10 +1,12 @@
 # main.py
 
 from fastapi import FastAPI, HTTPException, Query
-from fastapi.responses import JSONResponse
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 from typing import Optional
-import os
+import asyncio
+import orjson
 import time
 import requests
 import logging
@@ -48,17 +50,13 @@ try:
     from database import initialize_database
 
     # Explicitly initialize database before setting up agent
-    initialize_database()
-
-    # Check if database file exists
-    DB_FILE = "employee_database.db"
-    if not os.path.exists(DB_FILE):
-        logger.error(f"Database file {DB_FILE} not found after initialization")
+    if initialize_database():
+        logger.info("Database initialized")
     else:
-        logger.info(f"Database file {DB_FILE} exists")
+        logger.error("Database initialization failed")
 
     # Import agent after database is initialized
-    from agent import process_agent_query
+    from agent import process_agent_query, stream_agent_query
 
     logger.info("Successfully imported agent")
 except Exception as e:
@@ -77,22 +75,59 @@ app.add_middleware(
 )
 
 
+# Compress larger JSON bodies (e.g. responses with long reasoning steps); requests decodes gzip
+# transparently. Streaming routes bypass gzip: their frames are tiny, and a compressor may hold
+# tokens back in its buffer instead of sending them as they are generated.
+class GZipNonStreamingMiddleware:
+    def __init__(self, app, minimum_size=1024, streaming_paths=()):
+        self.app = app
+        self.gzip_app = GZipMiddleware(app, minimum_size=minimum_size)
+        self.streaming_paths = frozenset(streaming_paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"] in self.streaming_paths:
+            await self.app(scope, receive, send)
+        else:
+            await self.gzip_app(scope, receive, send)
+
+
+app.add_middleware(GZipNonStreamingMiddleware, minimum_size=1024, streaming_paths=("/query/stream",))
+
+
 @app.get("/query")
-def get_query(
+async def get_query(
     query: str = Query(..., description="The query to process."),
     conversation_id: Optional[str] = Query(None, description="Optional conversation ID for memory continuity.")
 ):
     if not query:
         raise HTTPException(status_code=400, detail="Query parameter is required.")
 
-    # Process the query using the agent from agent.py
+    # Process the query using the agent from agent.py in a worker thread,
+    # keeping the event loop free while the LLM is generating
     try:
-        result = process_agent_query(query, conversation_id)
+        result = await asyncio.to_thread(process_agent_query, query, conversation_id)
     except Exception as e:
         logger.error(f"Error processing query: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
-    return JSONResponse(content=result)
+    return ORJSONResponse(content=result)
+
+
+@app.get("/query/stream")
+async def stream_query(
+    query: str = Query(..., description="The query to process."),
+    conversation_id: Optional[str] = Query(None, description="Optional conversation ID for memory continuity.")
+):
+    if not query:
+        raise HTTPException(status_code=400, detail="Query parameter is required.")
+
+    # Forward agent events as newline-delimited JSON; the last frame carries the full result.
+    # The generator is async so Starlette iterates it on the event loop, not in a threadpool.
+    async def frame_generator():
+        async for event in stream_agent_query(query, conversation_id):
+            yield orjson.dumps(event) + b"\n"
+
+    return StreamingResponse(frame_generator(), media_type="application/x-ndjson")
 
 
 # Add a health check endpoint
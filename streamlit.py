@@ -2,13 +2,35 @@
 
 import streamlit as st
 import requests
-import json
+import orjson
+import base64
+import re
 import time
 from datetime import datetime
+from functools import lru_cache
+from pathlib import Path
+
+# Static assets (stylesheet) shipped next to this script
+ASSETS_DIR = Path(__file__).parent / "assets"
 
 # Define the base URL for the FastAPI backend
 BASE_URL = "http://localhost:8000"
 
+# Remote avatar images, inlined at startup by load_avatar_uri
+USER_AVATAR_URL = "https://api.dicebear.com/7.x/avataaars/svg?seed=Felix&backgroundColor=b6e3f4"
+BOT_AVATAR_URL = "https://api.dicebear.com/7.x/bottts/svg?seed=Dusty&backgroundColor=7C4DFF"
+
+# Upper bound on how long a backend call may block the script (agent runs take seconds)
+REQUEST_TIMEOUT = 120
+
+# Submissions closer together than this are coalesced into one backend call
+QUERY_DEBOUNCE_SECONDS = 0.15
+
+# Number of answered questions kept per session for instant repeats, and how long each stays
+# valid; the ETL reloads the data every 5 minutes, matching the backend's response cache TTL
+QUERY_CACHE_SIZE = 32
+QUERY_CACHE_TTL = 300  # seconds
+
 # Page configuration with dark theme
 st.set_page_config(
     page_title="HR Assistant",
@@ -17,244 +39,72 @@ st.set_page_config(
     initial_sidebar_state="collapsed"
 )
 
-# Custom CSS for dark theme UI
-st.markdown("""
-<style>
-    /* Dark theme base colors */
-    :root {
-        --background-color: #121212;
-        --card-bg-color: #1e1e1e;
-        --primary-color: #7C4DFF;
-        --secondary-color: #03DAC6;
-        --text-color: #E0E0E0;
-        --muted-color: #9E9E9E;
-        --user-message-bg: #2D3748;
-        --user-message-border: #4A5568;
-        --bot-message-bg: #1A365D;
-        --bot-message-border: #2C5282;
-        --highlight-color: #7C4DFF;
-    }
-
-    /* Override Streamlit's theme */
-    .reportview-container {
-        background-color: var(--background-color);
-        color: var(--text-color);
-    }
-
-    .main .block-container {
-        padding-top: 2rem;
-        padding-bottom: 7rem;
-        max-width: 800px;
-    }
-
-    /* Chat message containers */
-    .chat-message {
-        display: flex;
-        margin-bottom: 1.5rem;
-        align-items: flex-start;
-        border-radius: 1rem;
-        padding: 1.2rem;
-        position: relative;
-        animation: fadeIn 0.3s ease-in-out;
-    }
-
-    @keyframes fadeIn {
-        from { opacity: 0; transform: translateY(10px); }
-        to { opacity: 1; transform: translateY(0); }
-    }
-
-    .chat-message.user {
-        background-color: var(--user-message-bg);
-        border-left: 4px solid var(--user-message-border);
-        margin-left: 30px;
-        margin-right: 80px;
-    }
-
-    .chat-message.assistant {
-        background-color: var(--bot-message-bg);
-        border-left: 4px solid var(--bot-message-border);
-        margin-right: 30px;
-        margin-left: 80px;
-    }
-
-    /* Avatar styling */
-    .chat-message .avatar {
-        width: 48px;
-        min-width: 48px;
-        margin-right: 16px;
-        display: flex;
-        align-items: center;
-        justify-content: center;
-    }
-
-    .chat-message .avatar img {
-        max-width: 100%;
-        max-height: 100%;
-        border-radius: 50%;
-        object-fit: cover;
-        box-shadow: 0 2px 8px rgba(0,0,0,0.3);
-        border: 2px solid var(--highlight-color);
-    }
-
-    /* Message content */
-    .chat-message .message {
-        flex-grow: 1;
-        word-break: break-word;
-        overflow-wrap: break-word;
-        line-height: 1.6;
-    }
-
-    /* Timestamp styling */
-    .timestamp {
-        position: absolute;
-        bottom: 8px;
-        right: 12px;
-        font-size: 0.7rem;
-        color: var(--muted-color);
-        font-style: italic;
-    }
-
-    /* Input area styling */
-    .chat-input-container {
-        position: fixed;
-        bottom: 0;
-        left: 0;
-        width: 100%;
-        padding: 1rem 1.5rem;
-        background-color: rgba(18, 18, 18, 0.9);
-        backdrop-filter: blur(10px);
-        border-top: 1px solid #333;
-        z-index: 100;
-        display: flex;
-        flex-direction: column;
-    }
-
-    .stTextInput > div > div {
-        background-color: #2D3748;
-        border-radius: 25px;
-        border: 1px solid #4A5568;
-        padding-left: 15px;
-        color: white;
-    }
-
-    .stTextInput > div > div:focus-within {
-        border-color: var(--highlight-color);
-    }
-
-    /* Header & Title */
-    .main-title {
-        text-align: center;
-        color: var(--highlight-color);
-        font-size: 2.5rem;
-        font-weight: 600;
-        margin: 1rem 0 2rem 0;
-        padding-bottom: 0.5rem;
-        border-bottom: 2px solid var(--secondary-color);
-    }
-
-    .header-subtitle {
-        text-align: center;
-        color: var(--muted-color);
-        font-size: 1.1rem;
-        margin-bottom: 2rem;
-    }
-
-    /* Reasoning steps */
-    .expander-header {
-        color: var(--highlight-color);
-        font-weight: 600;
-    }
-
-    .steps-expander {
-        background-color: #1A1A1A;
-        border-radius: 0.5rem;
-        border: 1px solid #333;
-        padding: 1rem;
-        margin-top: 0.5rem;
-    }
-
-    .steps-expander h4 {
-        color: var(--secondary-color);
-        border-bottom: 1px solid #333;
-        padding-bottom: 0.5rem;
-    }
-
-    /* Initial greeting message */
-    .greeting-container {
-        text-align: center;
-        padding: 3rem 1rem;
-        background-color: rgba(30, 30, 30, 0.7);
-        border-radius: 1rem;
-        margin: 2rem 0;
-        border: 1px solid #333;
-    }
-
-    .greeting-container h3 {
-        color: var(--highlight-color);
-        margin-bottom: 1rem;
-    }
-
-    .greeting-container p {
-        color: var(--text-color);
-        font-size: 1.1rem;
-        line-height: 1.6;
-    }
-
-    /* Remove padding from spinner */
-    div.stSpinner > div {
-        text-align: center;
-        color: var(--highlight-color);
-        padding-top: 0;
-    }
-
-    /* Sidebar styling */
-    .css-1d391kg, .css-163ttbj, .css-1fcdlhc {
-        background-color: #1A1A1A;
-    }
-
-    /* Make sure other Streamlit elements match the theme */
-    button, .stButton>button {
-        background-color: var(--highlight-color);
-        color: white;
-        border: none;
-        border-radius: 5px;
-        padding: 0.5rem 1rem;
-        transition: all 0.3s;
-    }
-
-    button:hover, .stButton>button:hover {
-        background-color: #9161FF;
-        box-shadow: 0 0 10px rgba(124, 77, 255, 0.5);
-    }
-
-    /* JSON styling */
-    pre {
-        background-color: #2D3748;
-        border-radius: 5px;
-        padding: 0.75rem;
-        border-left: 3px solid var(--secondary-color);
-    }
-
-    /* Scrollbar styling */
-    ::-webkit-scrollbar {
-        width: 10px;
-        height: 10px;
-    }
-
-    ::-webkit-scrollbar-track {
-        background: #1e1e1e;
-    }
-
-    ::-webkit-scrollbar-thumb {
-        background: #424242;
-        border-radius: 5px;
-    }
-
-    ::-webkit-scrollbar-thumb:hover {
-        background: #555;
-    }
-</style>
-""", unsafe_allow_html=True)
+# Strip comments and redundant whitespace from a stylesheet. Deliberately simple: it keeps
+# the space before ':' (so descendant selectors like "a :hover" survive) and assumes no
+# comment markers or significant runs of whitespace inside quoted strings.
+def minify_css(css):
+    css = re.sub(r"/\*.*?\*/", "", css, flags=re.S)
+    css = re.sub(r"\s+", " ", css)
+    css = re.sub(r"\s*([{};,>])\s*", r"\1", css)
+    css = re.sub(r":\s+", ":", css)
+    return css.replace(";}", "}").strip()
+
+
+# Custom CSS for dark theme UI, read from disk and minified once per server process. It is
+# still emitted on every rerun, since Streamlit drops elements a rerun doesn't re-create.
+@st.cache_resource
+def load_theme_css():
+    return f"<style>{minify_css((ASSETS_DIR / 'theme.css').read_text())}</style>"
+
+
+st.markdown(load_theme_css(), unsafe_allow_html=True)
+
+
+# Reuse one HTTP session (and its keep-alive connection pool) across reruns
+@st.cache_resource
+def get_session():
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=16)
+    session.mount("http://", adapter)
+    return session
+
+
+# Download an avatar once per server process and inline it as a data URI, so the browser
+# doesn't fetch it per message; fall back to the remote URL if the download fails
+@st.cache_resource
+def load_avatar_uri(url):
+    try:
+        response = requests.get(url, timeout=5)
+        response.raise_for_status()
+    except requests.RequestException:
+        return url
+    return f"data:image/svg+xml;base64,{base64.b64encode(response.content).decode('ascii')}"
+
+
+USER_AVATAR_URI = load_avatar_uri(USER_AVATAR_URL)
+BOT_AVATAR_URI = load_avatar_uri(BOT_AVATAR_URL)
+
+
+# Streamlit markdown renders text between single dollar signs as LaTeX, which would turn
+# currency ranges like "$50,000 to $90,000" into math; escape them so they show literally
+def escape_dollars(text):
+    return text.replace("$", r"\$")
+
+
+# Yield agent tokens from the backend's NDJSON stream, reporting tool steps as they finish
+def stream_tokens(response, status, frames):
+    for line in response.iter_lines():
+        if not line:
+            continue
+        frame = orjson.loads(line)
+
+        if frame["type"] == "token":
+            yield escape_dollars(frame["content"])
+        elif frame["type"] == "step":
+            status.caption(f"🔧 Finished {frame['tool']}")
+        elif frame["type"] == "final":
+            frames["final"] = frame
+
 
 # Initialize session state for chat history if it doesn't exist
 if "messages" not in st.session_state:
@@ -264,29 +114,76 @@ if "messages" not in st.session_state:
 if "conversation_id" not in st.session_state:
     st.session_state.conversation_id = datetime.now().strftime("%Y%m%d%H%M%S")
 
+# Recent (conversation_id, normalized query) -> (cached_at, result) pairs, so exact repeats skip
+# the backend. A hit isn't added to the agent's conversation memory; the original exchange is
+# already there, so follow-ups keep their context.
+if "qcache" not in st.session_state:
+    st.session_state.qcache = {}
+
+# Last dispatch time, used to debounce repeated submissions
+if "last_submit_ts" not in st.session_state:
+    st.session_state.last_submit_ts = 0.0
+
+
+# Queue a submitted question exactly once and clear the input box. Without this the text
+# stays in the input and every later rerun (e.g. a sidebar click) would re-send it.
+def queue_query():
+    submitted = st.session_state.chat_input.strip()
+    now = time.monotonic()
+    if submitted and now - st.session_state.last_submit_ts > QUERY_DEBOUNCE_SECONDS:
+        st.session_state.pending_query = submitted
+        st.session_state.last_submit_ts = now
+    st.session_state.chat_input = ""
+
+
+# Look up a cached result, dropping it once it is older than QUERY_CACHE_TTL
+def get_cached_result(key):
+    entry = st.session_state.qcache.get(key)
+    if entry is None:
+        return None
+
+    cached_at, result = entry
+    if time.monotonic() - cached_at > QUERY_CACHE_TTL:
+        del st.session_state.qcache[key]
+        return None
+    return result
+
+
+# Remember a successful backend result for this session, evicting the oldest entry once full
+def cache_result(key, result):
+    if not result.get("success"):
+        return
+
+    qcache = st.session_state.qcache
+    if len(qcache) >= QUERY_CACHE_SIZE:
+        del qcache[next(iter(qcache))]
+    qcache[key] = (time.monotonic(), result)
+
+
+# Reset the conversation. Run as a button callback, so the click's own rerun already
+# renders the empty chat and no second st.rerun() pass is needed.
+def clear_chat():
+    st.session_state.messages = []
+    st.session_state.qcache = {}
+    st.session_state.conversation_id = datetime.now().strftime("%Y%m%d%H%M%S")
+
+
+# Format a message's nanosecond timestamp for display; messages from one submission share
+# the same ts_ns, so the assistant reply reuses the user message's formatted string
+@lru_cache(maxsize=1024)
+def format_timestamp(ts_ns):
+    return datetime.fromtimestamp(ts_ns / 1e9).strftime("%H:%M:%S")
+
 
 # Function to display a chat message
-def display_message(role, content, timestamp=None):
-    if role == "user":
-        avatar_url = "https://api.dicebear.com/7.x/avataaars/svg?seed=Felix&backgroundColor=b6e3f4"
-        bg_class = "user"
-    else:
-        avatar_url = "https://api.dicebear.com/7.x/bottts/svg?seed=Dusty&backgroundColor=7C4DFF"
-        bg_class = "assistant"
-
-    timestamp_str = f'<div class="timestamp">{timestamp}</div>' if timestamp else ""
-
-    st.markdown(f"""
-    <div class="chat-message {bg_class}">
-        <div class="avatar">
-            <img src="{avatar_url}">
-        </div>
-        <div class="message">
-            {content}
-            {timestamp_str}
-        </div>
-    </div>
-    """, unsafe_allow_html=True)
+def display_message(role, content, ts_ns=None):
+    avatar = USER_AVATAR_URI if role == "user" else BOT_AVATAR_URI
+
+    # Native chat elements are diffed by Streamlit, so unchanged history isn't re-sent as HTML
+    with st.chat_message(role, avatar=avatar):
+        st.markdown(escape_dollars(content))
+        if ts_ns:
+            st.caption(format_timestamp(ts_ns))
 
 
 # Main title and header
@@ -294,146 +191,164 @@ st.markdown("<h1 class='main-title'>Employee Database Assistant</h1>", unsafe_al
 st.markdown("<p class='header-subtitle'>Ask questions about employees, departments, salaries, and more</p>",
             unsafe_allow_html=True)
 
-# Chat container to hold messages
-chat_container = st.container()
-
-# Display initial greeting if no messages
-if not st.session_state.messages:
-    with chat_container:
+# Display previous messages once per full run; the fragment below only renders what it adds
+for message in st.session_state.messages:
+    display_message(message["role"], message["content"], message.get("ts_ns"))
+st.session_state.history_rendered = len(st.session_state.messages)
+
+
+# Input handling and responses rerun on their own when a question is submitted, so the
+# history above is not re-rendered on every turn
+@st.fragment
+def chat_fragment():
+    # The key gives the container a .st-key-new_messages class the theme animates
+    new_messages = st.container(key="new_messages")
+
+    with new_messages:
+        # Display initial greeting if no messages
+        if not st.session_state.messages and "pending_query" not in st.session_state:
+            st.markdown("""
+            <div class="greeting-container">
+                <h3>👋 Welcome to the Employee Database Assistant</h3>
+                <p>
+                    I can help you find information about employees, departments, salaries, and more.
+                    Try asking me questions like:
+                    <ul>
+                        <li>Who works in the Engineering department?</li>
+                        <li>What's the average salary by department?</li>
+                        <li>How many years of service does Jane Smith have?</li>
+                        <li>Who is the highest paid employee?</li>
+                    </ul>
+                </p>
+            </div>
+            """, unsafe_allow_html=True)
+
+        # Messages added by earlier fragment runs, which the full-run history hasn't shown yet
+        for message in st.session_state.messages[st.session_state.history_rendered:]:
+            display_message(message["role"], message["content"], message.get("ts_ns"))
+
+    # Chat input area at bottom
+    with st.container():
+        st.markdown('<div class="chat-input-container">', unsafe_allow_html=True)
+
+        placeholder = "Ask about employees, departments, salaries, or positions..."
+        st.text_input("", placeholder=placeholder, key="chat_input", label_visibility="collapsed",
+                      on_change=queue_query)
+
+        # Help text
         st.markdown("""
-        <div class="greeting-container">
-            <h3>👋 Welcome to the Employee Database Assistant</h3>
-            <p>
-                I can help you find information about employees, departments, salaries, and more.
-                Try asking me questions like:
-                <ul>
-                    <li>Who works in the Engineering department?</li>
-                    <li>What's the average salary by department?</li>
-                    <li>How many years of service does Jane Smith have?</li>
-                    <li>Who is the highest paid employee?</li>
-                </ul>
-            </p>
+        <div style="font-size: 0.8rem; color: var(--muted-color); margin-top: 0.5rem;">
+        Type a question and press Enter to send
         </div>
         """, unsafe_allow_html=True)
 
-# Display previous messages
-with chat_container:
-    for message in st.session_state.messages:
-        display_message(message["role"], message["content"], message.get("timestamp"))
-
-# Chat input area at bottom
-with st.container():
-    st.markdown('<div class="chat-input-container">', unsafe_allow_html=True)
-
-    placeholder = "Ask about employees, departments, salaries, or positions..."
-    query = st.text_input("", placeholder=placeholder, key="chat_input", label_visibility="collapsed")
-
-    # Help text
-    st.markdown("""
-    <div style="font-size: 0.8rem; color: var(--muted-color); margin-top: 0.5rem;">
-    Type a question and press Enter to send
-    </div>
-    """, unsafe_allow_html=True)
-
-    st.markdown('</div>', unsafe_allow_html=True)
-
-# Process the query when submitted
-if query:
-    # Add timestamp to the message
-    current_time = datetime.now().strftime("%H:%M:%S")
-
-    # Add user message to chat history
-    st.session_state.messages.append({
-        "role": "user",
-        "content": query,
-        "timestamp": current_time
-    })
-
-    # Display the user message (this will be appended to the existing messages)
-    display_message("user", query, current_time)
-
-    # Placeholder for bot response while waiting
-    with chat_container:
-        with st.spinner("Thinking..."):
-            try:
-                # Append conversation ID to help with context tracking
-                params = {
-                    "query": query,
-                    "conversation_id": st.session_state.conversation_id
-                }
-
-                # Send request to backend
-                response = requests.get(f"{BASE_URL}/query", params=params)
-
-                if response.status_code == 200:
-                    result = response.json()
-                    assistant_response = result["response"]
-
-                    # Add assistant response to chat history
-                    st.session_state.messages.append({
-                        "role": "assistant",
-                        "content": assistant_response,
-                        "timestamp": current_time,
-                        "steps": result.get("steps", [])  # Store steps for debugging
-                    })
-
-                    # Display assistant response
-                    display_message("assistant", assistant_response, current_time)
-
-                    # Show reasoning steps in an expander
-                    if "steps" in result and result["steps"]:
-                        with st.expander("🔍 View Reasoning Process", expanded=False):
-                            st.markdown('<div class="steps-expander">', unsafe_allow_html=True)
-
-                            for i, step in enumerate(result["steps"]):
-                                st.markdown(f"<h4>Step {i + 1}: {step['tool']}</h4>", unsafe_allow_html=True)
-                                st.markdown(f"**Input**: `{step['input']}`")
-                                st.markdown("**Result**:")
-
-                                # Format SQL results better
-                                if isinstance(step['output'], str) and step['tool'] == 'sql_db_query':
-                                    try:
-                                        if step['output'].strip().startswith('[') or step['output'].strip().startswith(
-                                                '{'):
-                                            data = json.loads(step['output'])
-                                            st.json(data)
-                                        else:
-                                            st.text(step['output'])
-                                    except:
-                                        st.text(step['output'])
-                                else:
-                                    st.text(step['output'])
-
-                                if i < len(result["steps"]) - 1:
-                                    st.markdown("<hr style='margin: 1.5rem 0; border-color: #333;'>",
-                                                unsafe_allow_html=True)
-
-                            st.markdown("</div>", unsafe_allow_html=True)
-
-                else:
-                    st.error(f"Error from backend: {response.status_code} - {response.text}")
-
-            except Exception as e:
-                st.error(f"An error occurred: {e}")
-
-    # Automatically scroll to the bottom
-    st.markdown(
-        """
-        <script>
-            document.getElementsByClassName('main')[0].scrollTo(0, document.getElementsByClassName('main')[0].scrollHeight);
-        </script>
-        """,
-        unsafe_allow_html=True
-    )
+        st.markdown('</div>', unsafe_allow_html=True)
+
+    # Process the query when submitted
+    query = st.session_state.pop("pending_query", None)
+    if query:
+        # Stamp the submission once; it is formatted only when a message is displayed
+        ts_ns = time.time_ns()
+
+        # Add user message to chat history
+        st.session_state.messages.append({
+            "role": "user",
+            "content": query,
+            "ts_ns": ts_ns
+        })
+
+        # Display the exchange below the earlier messages, above the input box
+        with new_messages:
+            display_message("user", query, ts_ns)
+
+            with st.spinner("Thinking..."):
+                try:
+                    # Exact repeats within this conversation are answered from the session cache
+                    cache_key = (st.session_state.conversation_id, query.strip().lower())
+                    result = get_cached_result(cache_key)
+
+                    if result is None:
+                        # Append conversation ID to help with context tracking
+                        params = {
+                            "query": query,
+                            "conversation_id": st.session_state.conversation_id
+                        }
+
+                        # Stream the agent's progress from the backend as newline-delimited JSON. The
+                        # with block returns the connection to the session's pool even if the stream
+                        # fails or Streamlit stops the script mid-stream for a new submission
+                        with get_session().get(f"{BASE_URL}/query/stream", params=params,
+                                               timeout=REQUEST_TIMEOUT, stream=True) as response:
+                            if response.status_code == 200:
+                                live_output = st.empty()
+                                live_status = st.empty()
+                                frames = {}
+
+                                with live_output.container():
+                                    st.write_stream(stream_tokens(response, live_status, frames))
+
+                                # The final answer replaces the live reasoning trace
+                                live_output.empty()
+                                live_status.empty()
+                                if "final" not in frames:
+                                    raise RuntimeError("Backend closed the stream without a final answer")
+                                result = frames["final"]
+                                cache_result(cache_key, result)
+                            else:
+                                st.error(f"Error from backend: {response.status_code} - {response.text}")
+
+                    if result is not None:
+                        assistant_response = result["response"]
+
+                        # Add assistant response to chat history
+                        st.session_state.messages.append({
+                            "role": "assistant",
+                            "content": assistant_response,
+                            "ts_ns": ts_ns,
+                            "steps": result.get("steps", [])  # Store steps for debugging
+                        })
+
+                        # Display assistant response
+                        display_message("assistant", assistant_response, ts_ns)
+
+                        # Show reasoning steps in an expander
+                        if "steps" in result and result["steps"]:
+                            with st.expander("🔍 View Reasoning Process", expanded=False):
+                                st.markdown('<div class="steps-expander">', unsafe_allow_html=True)
+
+                                for i, step in enumerate(result["steps"]):
+                                    st.markdown(f"<h4>Step {i + 1}: {step['tool']}</h4>", unsafe_allow_html=True)
+                                    st.markdown(f"**Input**: `{step['input']}`")
+                                    st.markdown("**Result**:")
+
+                                    # Format SQL results better; only parse output that looks like JSON
+                                    output = step['output']
+                                    if (step['tool'] == 'sql_db_query' and isinstance(output, str)
+                                            and output.lstrip()[:1] in ('[', '{')):
+                                        try:
+                                            st.json(orjson.loads(output))
+                                        except orjson.JSONDecodeError:
+                                            st.text(output)
+                                    else:
+                                        st.text(output)
+
+                                    if i < len(result["steps"]) - 1:
+                                        st.markdown("<hr style='margin: 1.5rem 0; border-color: #333;'>",
+                                                    unsafe_allow_html=True)
+
+                                st.markdown("</div>", unsafe_allow_html=True)
+
+                except Exception as e:
+                    st.error(f"An error occurred: {e}")
+
+
+chat_fragment()
 
 # Sidebar options
 with st.sidebar:
     st.markdown("<h3 style='color: #7C4DFF;'>Options</h3>", unsafe_allow_html=True)
 
-    if st.button("Clear Chat"):
-        st.session_state.messages = []
-        st.session_state.conversation_id = datetime.now().strftime("%Y%m%d%H%M%S")
-        st.rerun()
+    st.button("Clear Chat", on_click=clear_chat)
 
     st.markdown("---")
     st.markdown("<h4 style='color: #03DAC6;'>About</h4>", unsafe_allow_html=True)